@@ -1,11 +1,13 @@
 #!/usr/bin/env python
 """
-usage: sprint.py [--db <db>] [--sprint-len <N>] [--last-sprint-id <date>] SPRINT_ID [<command>] [<args>...]
+usage: sprint.py [--db <db>] [--sprint-len <N>] [--last-sprint-id <date>] [--format <fmt>] [--all] SPRINT_ID [<command>] [<args>...]
 
 Options:
     --db <db>               Where to find the sqlite db.
     --sprint-len <N>        Set sprint length to N weeks
     --last-sprint-id <date> Override the last sprint id, useful when changing sprint lengths
+    --format <fmt>          Report output format: text, json or csv [default: text]
+    --all                   Report on every finished sprint instead of just SPRINT_ID
 
 Commands:
     which                          Show dates or previous, current, next sprints
@@ -14,16 +16,20 @@ Commands:
     finish                         Finish the last sprint
     prepare                        Prepare for the current sprint
     start                          Start the current sprint
-    report                         Show report on the given sprint ID
+    report [--all]                 Show report on the given sprint ID (or all finished sprints)
     backup                         Backup the sprint state database
     state START|FINISH             Show state of tickets in given sprint
 
 """
 
+import csv
 import datetime
+import json
 import os
 import shutil
 import sqlite3
+import sys
+from collections import OrderedDict
 
 from bson import ObjectId
 from docopt import docopt
@@ -52,6 +58,13 @@ NIP_COLS = PUNT_COLS[1:]
 # any outgoing column
 OUT_COLS = COLS
 
+# report layout version, bump when report contents change so cached reports get recomputed
+# (board list changes are picked up automatically, see Sprint._lists_key)
+REPORT_VERSION = 2
+
+# report output formats
+REPORT_FORMATS = ('text', 'json', 'csv')
+
 # sprint length, in weeks
 DEFAULT_SPRINT_LEN = 2
 
@@ -102,6 +115,36 @@ class Sprint(NS1Base):
                   ''' snapshot_phase integer, from_roadmap integer)''')
         c.execute('''create unique index if not exists sprint_idx on sprint_state (sprint_id, list_id, '''
                   '''card_id, snapshot_phase)''')
+        c.execute('''create index if not exists sprint_card_idx on sprint_state (card_id)''')
+        # reports for finished sprints, dropped whenever a snapshot they were built from changes
+        c.execute('''create table if not exists report_cache (sprint_id text, version integer, '''
+                  '''previous_sprint_id text, report text, lists_key text, primary key (sprint_id, version))''')
+        # caches created before lists_key existed
+        c.execute('''pragma table_info(report_cache)''')
+        if 'lists_key' not in [col[1] for col in c.fetchall()]:
+            c.execute('''alter table report_cache add column lists_key text''')
+        c.execute('''create index if not exists report_cache_prev_idx on report_cache (previous_sprint_id)''')
+        c.execute('''create trigger if not exists report_cache_insert after insert on sprint_state begin '''
+                  '''delete from report_cache where sprint_id=NEW.sprint_id or previous_sprint_id=NEW.sprint_id; '''
+                  '''end''')
+        c.execute('''create trigger if not exists report_cache_update after update on sprint_state begin '''
+                  '''delete from report_cache where sprint_id in (OLD.sprint_id, NEW.sprint_id) '''
+                  '''or previous_sprint_id in (OLD.sprint_id, NEW.sprint_id); end''')
+        c.execute('''create trigger if not exists report_cache_delete after delete on sprint_state begin '''
+                  '''delete from report_cache where sprint_id=OLD.sprint_id or previous_sprint_id=OLD.sprint_id; '''
+                  '''end''')
+        # reports also read card labels and due dates, so drop them when those actually change
+        c.execute('''create trigger if not exists report_cache_card_insert after insert on cards begin '''
+                  '''delete from report_cache where sprint_id in '''
+                  '''(select sprint_id from sprint_state where card_id=NEW.card_id); end''')
+        c.execute('''drop trigger if exists report_cache_card_update''')
+        c.execute('''create trigger if not exists report_cache_card_change after update of labels, due_date '''
+                  '''on cards when OLD.labels is not NEW.labels or OLD.due_date is not NEW.due_date begin '''
+                  '''delete from report_cache where sprint_id in '''
+                  '''(select sprint_id from sprint_state where card_id=NEW.card_id); end''')
+        c.execute('''create trigger if not exists report_cache_card_delete after delete on cards begin '''
+                  '''delete from report_cache where sprint_id in '''
+                  '''(select sprint_id from sprint_state where card_id=OLD.card_id); end''')
         self._db.commit()
         c.close()
 
@@ -161,8 +204,12 @@ class Sprint(NS1Base):
         c = self._db.cursor()
         labels = [l.name for l in card.labels]
         create_date = ObjectId(card.id).generation_time
-        c.execute('''insert or replace into cards values (?, ?, ?, ?, ?, ?)''',
-                  (card.id, create_date, datetime.datetime.today().isoformat(' '), card.due_date, ','.join(labels), card.name))
+        row = (create_date, datetime.datetime.today().isoformat(' '), card.due_date, ','.join(labels), card.name)
+        # update in place rather than insert or replace, so unchanged cards keep their cached reports
+        c.execute('''update cards set create_date=?, sprint_add_date=?, due_date=?, labels=?, name=? '''
+                  '''where card_id=?''', row + (card.id, ))
+        if c.rowcount == 0:
+            c.execute('''insert into cards values (?, ?, ?, ?, ?, ?)''', (card.id, ) + row)
         c.close()
 
     def cards(self):
@@ -327,33 +374,6 @@ class Sprint(NS1Base):
         # send to s3
         shutil.copy(self._db_name, "%s.bak" % (self._db_name))
 
-    def _report_count(self, sql, *args, **kwargs):
-        c = self._db.cursor()
-        r = c.execute(sql, *args, **kwargs)
-        result = r.fetchall()
-        c.close()
-        return result[0][0]
-
-    def _get_card_map(self, sprint_id, phase):
-        c = self._db.cursor()
-        sql = '''select card_id, list_id from sprint_state where snapshot_phase=? and sprint_id=?'''
-        r = c.execute(sql, (phase, sprint_id, ))
-        # list_id => [card_id, ...]
-        map = {}
-        for rec in r.fetchall():
-            lname = self.list_names_by_id[rec[1]]
-            if lname not in map:
-                map[lname] = []
-            map[lname].append(rec[0])
-        c.close()
-        return map
-
-    def _array_marks(self, arr):
-        if arr is None:
-            return ''
-        quoted = ['"%s"' % v for v in arr]
-        return ','.join(quoted)
-
     def _pperc(self, part, total):
         if total == 0:
             return 'NaN'
@@ -371,146 +391,139 @@ class Sprint(NS1Base):
             print r
         c.close()
 
-    def _due_dates(self, sprint_id):
+    def _get_sprints(self):
+        # [(sprint_id, last day of sprint, finished), ...] in sprint order
         c = self._db.cursor()
-        sql = '''select date(due_date) from sprint_state, cards,
-                 lists where sprint_id=? and snapshot_phase=? and cards.card_id=sprint_state.card_id
-                 and sprint_state.list_id=lists.list_id'''
-        r = c.execute(sql, (sprint_id, FINISH))
-        result = r.fetchall()
-        num_w_dates = 0
-        num_overdue = 0
-        last_day_of_sprint = self.next_sprint_start - datetime.timedelta(days=1)
-        for r in result:
-            if r[0] is None or r[0] == '':
-                continue
-            else:
-                num_w_dates += 1
-                dd = datetime.datetime.strptime(r[0], "%Y-%m-%d")
-                if last_day_of_sprint > dd:
-                    num_overdue += 1
+        sql = '''select sprint_id, date(end_date), finished from sprints order by start_date'''
+        r = c.execute(sql)
+        sprints = [(rec[0], datetime.datetime.strptime(rec[1], "%Y-%m-%d"), int(rec[2]) == 1)
+                   for rec in r.fetchall()]
         c.close()
-        return (num_w_dates, num_overdue)
-
-    def report(self, sprint_id):
-        print "Sprint Report %s (compared to previous %s)" % (sprint_id, self.last_sprint_id)
-
-        assert(sprint_id != self.last_sprint_id)
+        return sprints
 
-        # get a list of card ids from all the lists from last sprint finish, so we can see how they changed
-        # (or not) to this sprint
-        last_finish_map = self._get_card_map(self.last_sprint_id, FINISH)
+    def _get_snapshots(self, sprint_ids=None):
+        # (sprint_id, snapshot_phase) => [(card_id, list_id, from_roadmap, known_card, labels, due_date), ...]
+        c = self._db.cursor()
+        sql = '''select sprint_state.sprint_id, snapshot_phase, sprint_state.card_id, list_id, from_roadmap,
+                 cards.card_id is not null, cards.labels, date(cards.due_date) from sprint_state
+                 left join cards on cards.card_id=sprint_state.card_id'''
+        if sprint_ids is None:
+            r = c.execute(sql)
+        else:
+            sql += ''' where sprint_state.sprint_id in (%s)''' % ','.join('?' * len(sprint_ids))
+            r = c.execute(sql, sprint_ids)
+        snapshots = {}
+        for rec in r.fetchall():
+            snapshots.setdefault((rec[0], int(rec[1])), []).append(rec[2:])
+        c.close()
+        return snapshots
 
-        # for l in self.list_ids:
-        #     print l
-        #     print last_finish_map[self.list_ids[l]]
+    def _get_cached_reports(self, sprint_ids=None):
+        # sprint_id => (previous_sprint_id, report), only for reports built with the current board lists
+        c = self._db.cursor()
+        sql = '''select sprint_id, previous_sprint_id, report from report_cache where version=? and lists_key=?'''
+        params = [REPORT_VERSION, self._lists_key()]
+        if sprint_ids is not None:
+            sql += ''' and sprint_id in (%s)''' % ','.join('?' * len(sprint_ids))
+            params.extend(sprint_ids)
+        r = c.execute(sql, params)
+        cached = {}
+        for rec in r.fetchall():
+            cached[rec[0]] = (rec[1], json.loads(rec[2], object_pairs_hook=OrderedDict))
+        c.close()
+        return cached
 
-        sql = '''select count(*) from sprint_state where sprint_id=? and snapshot_phase=1'''
-        total_at_start = self._report_count(sql, (sprint_id, ))
-        sql = '''select count(*) from sprint_state where sprint_id=? and snapshot_phase=2'''
-        total_at_finish = self._report_count(sql, (sprint_id, ))
+    def _cache_report(self, report):
+        c = self._db.cursor()
+        c.execute('''insert or replace into report_cache (sprint_id, version, previous_sprint_id, report, '''
+                  '''lists_key) values (?, ?, ?, ?, ?)''',
+                  (report['sprint_id'], REPORT_VERSION, report['previous_sprint_id'], json.dumps(report),
+                   self._lists_key()))
+        c.close()
 
-        # incoming: new to this sprint
-        print "INCOMING"
-        print " -- NEW"
+    def _lists_key(self):
+        # reports map column names to the board's open lists, so renamed/closed/recreated lists
+        # must not reuse reports built against the old mapping
+        return json.dumps([(col, self.list_ids.get(col)) for col in COLS])
 
-        ### num incoming from sprint roadmaps (excluding cards carried over form last sprint)
-        sql = '''select count(*) from sprint_state, cards where sprint_id=? and snapshot_phase=1 and
-                 from_roadmap=1 and list_id=? and cards.card_id=sprint_state.card_id
-                 and sprint_state.card_id not in (%s)''' % (self._array_marks(last_finish_map.get('New', None)))
-        print "Incoming From Sprint Roadmap"
-        incoming_roadmap = self._report_count(sql, (sprint_id, self.list_ids['New']))
-        print incoming_roadmap
+    def _build_report(self, sprint_id, previous_sprint_id, last_day_of_sprint, snapshots):
+        at_start = snapshots.get((sprint_id, START), [])
+        at_finish = snapshots.get((sprint_id, FINISH), [])
 
+        # list_id => set of card ids from last sprint finish, so we can see how they changed
+        # (or not) to this sprint
+        last_finish_map = {}
+        for rec in snapshots.get((previous_sprint_id, FINISH), []):
+            last_finish_map.setdefault(rec[1], set()).add(rec[0])
+
+        report = OrderedDict()
+        report['sprint_id'] = sprint_id
+        report['previous_sprint_id'] = previous_sprint_id
+        report['version'] = REPORT_VERSION
+        report['total_at_start'] = len(at_start)
+        report['total_at_finish'] = len(at_finish)
+
+        # incoming: new to this sprint (excluding cards carried over from last sprint)
+        new_id = self.list_ids.get(START_COL)
+        carried_new = last_finish_map.get(new_id, set())
+        incoming = [rec for rec in at_start if rec[1] == new_id and rec[3] and rec[0] not in carried_new]
+        ### num incoming from sprint roadmaps
+        report['incoming_roadmap'] = len([rec for rec in incoming if rec[2] == 1])
         ### num added to New column after Prep (after incoming from roadmap) but before Start
-        sql = '''select count(*) from sprint_state, cards where sprint_id=? and snapshot_phase=1 and
-                 from_roadmap=0 and list_id=? and cards.card_id=sprint_state.card_id
-                 and sprint_state.card_id not in (%s)''' % (self._array_marks(last_finish_map.get('New', None)))
-        print "Additional Incoming At Sprint Planning Time"
-        incoming_adhoc = self._report_count(sql, (sprint_id, self.list_ids['New']))
-        print incoming_adhoc
-
-        ### total new at start
-        sql = '''select count(*) from sprint_state, cards where sprint_id=? and snapshot_phase=1 and
-                 list_id=? and cards.card_id=sprint_state.card_id
-                 and sprint_state.card_id not in (%s)''' % (self._array_marks(last_finish_map.get('New', None)))
-        total_incoming = self._report_count(sql, (sprint_id, self.list_ids['New']))
-        assert(total_incoming == (incoming_adhoc + incoming_roadmap))
-        print "TOTAL INCOMING NEW: %s" % (self._pperc(total_incoming, total_at_start))
-
-        # incoming: punted/existed in last sprint
-        print " -- PUNTED/CARRYOVER"
+        report['incoming_adhoc'] = len([rec for rec in incoming if rec[2] == 0])
+        report['total_incoming'] = len(incoming)
+        assert(report['total_incoming'] == (report['incoming_adhoc'] + report['incoming_roadmap']))
 
-        ### num punted from last sprint in various columns
-        punt_counts = 0
+        # incoming: punted/existed in last sprint, in the same column
+        # (None when the column was empty at last sprint finish, so nothing could be punted from it)
+        report['punted'] = OrderedDict()
         for pc in PUNT_COLS:
-            if pc not in last_finish_map:
+            lid = self.list_ids.get(pc)
+            if lid not in last_finish_map:
+                report['punted'][pc] = None
                 continue
-            sql = '''select count(*) from sprint_state where sprint_id=? and snapshot_phase=1 and
-                     list_id=? and sprint_state.card_id in (%s)''' % (self._array_marks(last_finish_map[pc]))
-            print "Punted From Last Sprint: %s" % pc
-            rc = self._report_count(sql, (sprint_id, self.list_ids[pc]))
-            punt_counts += int(rc)
-            print rc
-
-        print "TOTAL INCOMING PUNTED: %s" % (self._pperc(punt_counts, total_at_start))
+            report['punted'][pc] = len([rec for rec in at_start
+                                        if rec[1] == lid and rec[0] in last_finish_map[lid]])
+        report['total_punted'] = sum(rc for rc in report['punted'].values() if rc is not None)
 
         # incoming: dropped into a column ad hoc, skipping New
-        print " -- NEW, BUT ALREADY IN PROGRESS"
-
-        ### num added to a column this sprint which wasn't in last sprint and skipped new
-        nip_counts = 0
+        report['new_in_progress'] = OrderedDict()
         for pc in NIP_COLS:
-            if pc not in last_finish_map:
-                continue
-            sql = '''select count(*) from sprint_state where sprint_id=? and snapshot_phase=1 and
-                     list_id=? and sprint_state.card_id not in (%s)''' % (self._array_marks(last_finish_map[pc]))
-            print "New In Progress This Sprint: %s" % pc
-            rc = self._report_count(sql, (sprint_id, self.list_ids[pc]))
-            nip_counts += int(rc)
-            print rc
+            lid = self.list_ids.get(pc)
+            carried = last_finish_map.get(lid, set())
+            report['new_in_progress'][pc] = len([rec for rec in at_start
+                                                 if rec[1] == lid and rec[0] not in carried])
+        report['total_new_in_progress'] = sum(report['new_in_progress'].values())
 
-        print "TOTAL INCOMING IN PROGRESS: %s" % (self._pperc(nip_counts, total_at_start))
-
-        print "TOTAL AT SPRINT START: %s" % (total_at_start)
-        assert(total_incoming + punt_counts + nip_counts == total_at_start)
-
-        print "=-=-=-=-=-=-=-=-=-="
-        print "OUTGOING"
-        print " -- TOTALS"
+        assert(report['total_incoming'] + report['total_punted'] + report['total_new_in_progress'] ==
+               report['total_at_start'])
 
         # outgoing
         ### num in each column
-        out_counts = 0
+        report['outgoing'] = OrderedDict()
         for pc in OUT_COLS:
-            sql = '''select count(*) from sprint_state where sprint_id=? and snapshot_phase=2 and list_id=?'''
-            print "Outgoing: %s" % pc
-            rc = self._report_count(sql, (sprint_id, self.list_ids[pc]))
-            out_counts += int(rc)
-            if pc == TARGET_COL:
-                done_count = int(rc)
-            print self._pperc(rc, total_at_finish)
-
-        print "TOTAL OUTGOING: %s" % (out_counts)
-        assert(total_at_finish == out_counts)
+            lid = self.list_ids.get(pc)
+            report['outgoing'][pc] = len([rec for rec in at_finish if rec[1] == lid])
+        report['total_outgoing'] = sum(report['outgoing'].values())
+        assert(report['total_at_finish'] == report['total_outgoing'])
 
         ### num per label
+        report['labels'] = OrderedDict()
         for l in LABELS:
-            sql = '''select count(*) from sprint_state, cards where sprint_id=? and snapshot_phase=2
-                     and cards.card_id=sprint_state.card_id and instr(cards.labels, "%s")''' % l
-            num_label = self._report_count(sql, (sprint_id, ))
-            print "TOTAL LABEL %s: %s" % (l, self._pperc(num_label, total_at_finish))
+            report['labels'][l] = len([rec for rec in at_finish if rec[3] and l in rec[4]])
 
         ### in to out ratio
-        print "INCOMING to DONE RATIO: %s:%s/%f" % (total_incoming,
-                                                    done_count,
-                                                    float(total_incoming)/done_count)
+        report['done'] = report['outgoing'][TARGET_COL]
+        if report['done']:
+            report['incoming_done_ratio'] = float(report['total_incoming']) / report['done']
+        else:
+            report['incoming_done_ratio'] = None
 
-        ### num overdue
         ### num w due dates
-        (num_w_dates, num_overdue) = self._due_dates(sprint_id)
-        print "OUTGOING WITH DUEDATES: %s" % (self._pperc(num_w_dates, out_counts))
-        print "OUTGOING OVERDUE: %s" % (self._pperc(num_overdue, out_counts))
+        ### num overdue
+        due_dates = [datetime.datetime.strptime(rec[5], "%Y-%m-%d") for rec in at_finish if rec[3] and rec[5]]
+        report['outgoing_with_due_dates'] = len(due_dates)
+        report['outgoing_overdue'] = len([dd for dd in due_dates if last_day_of_sprint > dd])
 
         ### now many NEW fires this sprint?
 
@@ -518,6 +531,147 @@ class Sprint(NS1Base):
         ### avg age of open tickets
         ### avg length in sprint
 
+        return report
+
+    def report(self, sprint_id, previous_sprint_id=None):
+        # compare to the nearest earlier finished sprint, unless told otherwise
+        found = None
+        last_finished = None
+        for s in self._get_sprints():
+            if s[0] == sprint_id:
+                found = s
+                break
+            if s[2]:
+                last_finished = s[0]
+        if found is None:
+            raise Exception('Unknown sprint %s' % sprint_id)
+        (sprint_id, last_day_of_sprint, finished) = found
+        if previous_sprint_id is None:
+            previous_sprint_id = last_finished
+
+        assert(sprint_id != previous_sprint_id)
+
+        if finished:
+            cached = self._get_cached_reports([sprint_id]).get(sprint_id)
+            if cached and cached[0] == previous_sprint_id:
+                return cached[1]
+
+        snapshots = self._get_snapshots([sprint_id, previous_sprint_id])
+        report = self._build_report(sprint_id, previous_sprint_id, last_day_of_sprint, snapshots)
+        if finished:
+            self._cache_report(report)
+            self._db.commit()
+        return report
+
+    def report_all(self):
+        # one pass over every finished sprint, each compared to the finished sprint before it
+        cached = self._get_cached_reports()
+        snapshots = None
+        reports = []
+        previous_sprint_id = None
+        for (sprint_id, last_day_of_sprint, finished) in self._get_sprints():
+            if not finished:
+                continue
+            hit = cached.get(sprint_id)
+            if hit and hit[0] == previous_sprint_id:
+                reports.append(hit[1])
+            else:
+                if snapshots is None:
+                    snapshots = self._get_snapshots()
+                try:
+                    report = self._build_report(sprint_id, previous_sprint_id, last_day_of_sprint, snapshots)
+                except AssertionError:
+                    # don't let one inconsistent sprint stop the whole history
+                    sys.stderr.write("SKIPPING sprint %s, its snapshots don't add up\n" % sprint_id)
+                else:
+                    self._cache_report(report)
+                    reports.append(report)
+            previous_sprint_id = sprint_id
+        self._db.commit()
+        return reports
+
+    def _flatten_report(self, report):
+        row = OrderedDict()
+        for k, v in report.items():
+            if isinstance(v, dict):
+                for sk, sv in v.items():
+                    row['%s:%s' % (k, sk)] = sv
+            else:
+                row[k] = v
+        return row
+
+    def print_report(self, report):
+        print "Sprint Report %s (compared to previous %s)" % (report['sprint_id'], report['previous_sprint_id'])
+
+        print "INCOMING"
+        print " -- NEW"
+        print "Incoming From Sprint Roadmap"
+        print report['incoming_roadmap']
+        print "Additional Incoming At Sprint Planning Time"
+        print report['incoming_adhoc']
+        print "TOTAL INCOMING NEW: %s" % (self._pperc(report['total_incoming'], report['total_at_start']))
+
+        print " -- PUNTED/CARRYOVER"
+        for pc, rc in report['punted'].items():
+            if rc is None:
+                continue
+            print "Punted From Last Sprint: %s" % pc
+            print rc
+        print "TOTAL INCOMING PUNTED: %s" % (self._pperc(report['total_punted'], report['total_at_start']))
+
+        print " -- NEW, BUT ALREADY IN PROGRESS"
+        for pc, rc in report['new_in_progress'].items():
+            if report['punted'][pc] is None and rc == 0:
+                continue
+            print "New In Progress This Sprint: %s" % pc
+            print rc
+        print "TOTAL INCOMING IN PROGRESS: %s" % (self._pperc(report['total_new_in_progress'],
+                                                             report['total_at_start']))
+
+        print "TOTAL AT SPRINT START: %s" % (report['total_at_start'])
+
+        print "=-=-=-=-=-=-=-=-=-="
+        print "OUTGOING"
+        print " -- TOTALS"
+        for pc, rc in report['outgoing'].items():
+            print "Outgoing: %s" % pc
+            print self._pperc(rc, report['total_at_finish'])
+        print "TOTAL OUTGOING: %s" % (report['total_outgoing'])
+
+        for l, num_label in report['labels'].items():
+            print "TOTAL LABEL %s: %s" % (l, self._pperc(num_label, report['total_at_finish']))
+
+        if report['incoming_done_ratio'] is None:
+            print "INCOMING to DONE RATIO: %s:%s/NaN" % (report['total_incoming'], report['done'])
+        else:
+            print "INCOMING to DONE RATIO: %s:%s/%f" % (report['total_incoming'],
+                                                        report['done'],
+                                                        report['incoming_done_ratio'])
+
+        print "OUTGOING WITH DUEDATES: %s" % (self._pperc(report['outgoing_with_due_dates'],
+                                                          report['total_outgoing']))
+        print "OUTGOING OVERDUE: %s" % (self._pperc(report['outgoing_overdue'], report['total_outgoing']))
+
+    def output_reports(self, reports, fmt='text'):
+        if fmt == 'json':
+            print json.dumps(reports, indent=2, separators=(',', ': '))
+        elif fmt == 'csv':
+            rows = [self._flatten_report(r) for r in reports]
+            fields = []
+            for row in rows:
+                fields.extend([k for k in row if k not in fields])
+            writer = csv.DictWriter(sys.stdout, fieldnames=fields)
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(row)
+        elif fmt == 'text':
+            for i, r in enumerate(reports):
+                if i:
+                    print
+                self.print_report(r)
+        else:
+            raise Exception('Unknown report format %s, use one of %s' % (fmt, ', '.join(REPORT_FORMATS)))
+
 
 
 if __name__ == "__main__":
@@ -531,6 +685,9 @@ if __name__ == "__main__":
     if args['--db'] is None:
         args['--db'] = os.getenv('HOME') + '/.ns1sprint.db'
 
+    if args['--format'] not in REPORT_FORMATS:
+        raise Exception('Unknown report format %s, use one of %s' % (args['--format'], ', '.join(REPORT_FORMATS)))
+
     t = Sprint(args['--db'])
 
     if args['--sprint-len']:
@@ -562,7 +719,11 @@ if __name__ == "__main__":
             phase = START
         t.show_state(phase)
     elif args['<command>'] == 'report':
-        t.report(args['SPRINT_ID'])
+        if args['--all']:
+            reports = t.report_all()
+        else:
+            reports = [t.report(args['SPRINT_ID'], args['--last-sprint-id'])]
+        t.output_reports(reports, args['--format'])
     else:
         print "unknown command: %s" % args['<command>']
 